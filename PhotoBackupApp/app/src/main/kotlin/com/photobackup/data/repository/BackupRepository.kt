@@ -285,6 +285,22 @@ class BackupRepository @Inject constructor(
                 return@withContext BackupResult.AlreadyExists
             }
 
+            // Ask the server before sending the file; on any failure just upload,
+            // the server skips duplicates on upload too
+            val existsOnServer = try {
+                val checkResponse = api.checkFiles(
+                    apiKey = apiKey,
+                    request = FileCheckRequest(listOf(fileHash))
+                )
+                checkResponse.isSuccessful && checkResponse.body()?.existing?.contains(fileHash) == true
+            } catch (e: Exception) {
+                false
+            }
+            if (existsOnServer) {
+                android.util.Log.d("BackupRepository", "uploadFile: Server already has file, skipping upload")
+                return@withContext BackupResult.AlreadyExists
+            }
+
             // Open file stream for upload using source-appropriate method
             android.util.Log.d("BackupRepository", "uploadFile: Opening file stream...")
             val inputStream = openInputStream(file)
@@ -1,10 +1,88 @@
+import atexit
+import base64
+import dataclasses
+import functools
+import json
 import logging
-import secrets
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
 import uuid
 from pathlib import Path
 
-from pydantic_settings import BaseSettings
+# Records logged anywhere in the process are queued here and written
+# to the log file and console by the listener thread.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_listener: logging.handlers.QueueListener | None = None
+
+# File writes are buffered and flushed on ERROR, when the buffer is full,
+# every LOG_FLUSH_INTERVAL seconds and on shutdown.
+LOG_BUFFER_CAPACITY = 512
+LOG_FLUSH_INTERVAL = 30.0
+_log_buffer: logging.handlers.MemoryHandler | None = None
+_log_flush_timer: threading.Timer | None = None
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler with a large write buffer that doesn't flush per record.
+
+    Records are flushed when the buffer fills, on ERROR, and whenever
+    flush() is called (by the periodic log flush and on close).
+    """
+
+    BUFFER_SIZE = 1024 * 1024  # 1MB
+
+    def _open(self):
+        return open(
+            self.baseFilename,
+            self.mode,
+            buffering=self.BUFFER_SIZE,
+            encoding=self.encoding,
+            errors=self.errors,
+        )
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.stream is None:
+            if self.mode != 'w' or not self._closed:
+                self.stream = self._open()
+        if not self.stream:
+            return
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= logging.ERROR:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class CachingFormatter(logging.Formatter):
+    """
+    Formatter that formats each second's timestamp only once.
+
+    Records logged within the same second reuse the strftime() result.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_time: tuple[int, str] = (-1, "")
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        second = int(record.created)
+        cached_second, formatted = self._cached_time
+        if second != cached_second:
+            formatted = time.strftime(
+                datefmt or self.default_time_format, self.converter(record.created)
+            )
+            self._cached_time = (second, formatted)
+        if datefmt:
+            return formatted
+        return self.default_msec_format % (formatted, record.msecs)
 
 
 def get_log_file_path(storage_path: Path) -> Path:
@@ -12,34 +90,61 @@ def get_log_file_path(storage_path: Path) -> Path:
     return storage_path / "server.log"
 
 
-def setup_logging(storage_path: Path) -> logging.Handler:
+def setup_logging(storage_path: Path) -> None:
     """
     Configure logging to write to a file in the storage directory.
     The log file is recreated on each server restart.
 
-    Returns the file handler so it can be used by uvicorn config.
+    The file and console handlers run behind a QueueListener thread; the
+    root logger only gets a QueueHandler, so logging from the event loop
+    never blocks on disk or console writes.
+
+    Calling it again replaces the previous configuration, so the log file
+    is only ever open through a single handler.
     """
+    global _log_listener, _log_buffer
+
+    # Close handlers from an earlier call instead of leaking their files
+    stop_logging()
+
     log_file = get_log_file_path(storage_path)
 
     # Ensure storage directory exists
     storage_path.mkdir(parents=True, exist_ok=True)
 
     # Create a file handler that overwrites the log file on each start
-    file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8')
+    file_handler = BufferedFileHandler(log_file, mode='w', encoding='utf-8')
     file_handler.setLevel(logging.INFO)
 
+    # Batch records in memory so bursts of log lines become a few large writes
+    _log_buffer = logging.handlers.MemoryHandler(
+        LOG_BUFFER_CAPACITY,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True,
+    )
+
     # Create console handler for stdout (will show when not hidden)
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(logging.INFO)
 
     # Create formatter
-    formatter = logging.Formatter(
+    formatter = CachingFormatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
+        datefmt='%Y-%m-%d %H:%M:%S',
+        style='%',
+        validate=False,
     )
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
+    # Drain the log queue into the real handlers on a background thread
+    _log_listener = logging.handlers.QueueListener(
+        _log_queue, _log_buffer, console_handler, respect_handler_level=True
+    )
+    _log_listener.start()
+    _schedule_log_flush()
+
     # Configure root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
@@ -47,141 +152,211 @@ def setup_logging(storage_path: Path) -> logging.Handler:
     # Remove any existing handlers
     root_logger.handlers.clear()
 
-    # Add our handlers
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
+    # Add our handler
+    root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
 
-    return file_handler
 
+def _schedule_log_flush() -> None:
+    """Flush buffered log records after LOG_FLUSH_INTERVAL seconds."""
+    global _log_flush_timer
 
-def get_uvicorn_log_config(storage_path: Path) -> dict:
-    """
-    Get uvicorn logging configuration that writes to our log file.
+    _log_flush_timer = threading.Timer(LOG_FLUSH_INTERVAL, _flush_log_buffer)
+    _log_flush_timer.daemon = True
+    _log_flush_timer.start()
+
+
+def _flush_log_buffer() -> None:
+    """Write buffered log records to disk and re-arm the flush timer."""
+    log_buffer = _log_buffer
+    if log_buffer is None:
+        return
+    log_buffer.flush()
+    if log_buffer.target is not None:
+        log_buffer.target.flush()
+    _schedule_log_flush()
+
+
+def stop_logging() -> None:
+    """Stop the log listener, write any queued or buffered records and close the log file."""
+    global _log_listener, _log_buffer
+
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+    if _log_buffer is not None:
+        log_buffer = _log_buffer
+        _log_buffer = None
+        if _log_flush_timer is not None:
+            _log_flush_timer.cancel()
+        file_handler = log_buffer.target
+        log_buffer.close()
+        if file_handler is not None:
+            file_handler.close()
+
+
+# Whatever setup_logging configured last is written out on exit
+atexit.register(stop_logging)
+
+
+def get_uvicorn_log_config() -> dict:
     """
-    log_file = str(get_log_file_path(storage_path))
+    Get uvicorn logging configuration.
 
+    The config is incremental: it only sets uvicorn's log levels and leaves
+    the handlers from setup_logging in place (a full dictConfig would close
+    them). Uvicorn records propagate to the root logger, and from there to
+    the log file and console.
+    """
     return {
         "version": 1,
-        "disable_existing_loggers": False,
-        "formatters": {
-            "default": {
-                "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-                "datefmt": "%Y-%m-%d %H:%M:%S",
-            },
-            "access": {
-                "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-                "datefmt": "%Y-%m-%d %H:%M:%S",
-            },
-        },
-        "handlers": {
-            "default": {
-                "formatter": "default",
-                "class": "logging.FileHandler",
-                "filename": log_file,
-                "mode": "a",  # Append since we already created the file
-            },
-            "access": {
-                "formatter": "access",
-                "class": "logging.FileHandler",
-                "filename": log_file,
-                "mode": "a",
-            },
-            "console": {
-                "formatter": "default",
-                "class": "logging.StreamHandler",
-                "stream": "ext://sys.stdout",
-            },
-        },
+        "incremental": True,
         "loggers": {
-            "uvicorn": {
-                "handlers": ["default", "console"],
-                "level": "INFO",
-                "propagate": False,
-            },
-            "uvicorn.error": {
-                "handlers": ["default", "console"],
-                "level": "INFO",
-                "propagate": False,
-            },
-            "uvicorn.access": {
-                "handlers": ["access", "console"],
-                "level": "INFO",
-                "propagate": False,
-            },
+            "uvicorn": {"level": "INFO"},
+            "uvicorn.error": {"level": "INFO"},
+            "uvicorn.access": {"level": "INFO"},
         },
     }
 
 
-def _load_or_create_api_key(storage_path: Path) -> str:
-    """Load API key from file, or create a new one if it doesn't exist."""
-    api_key_file = storage_path / ".api_key"
+def _generate_api_key() -> str:
+    """Generate a random URL-safe API key from 32 bytes of OS randomness."""
+    return base64.urlsafe_b64encode(os.urandom(32)).rstrip(b"=").decode("ascii")
 
-    # Ensure storage directory exists
-    storage_path.mkdir(parents=True, exist_ok=True)
 
-    if api_key_file.exists():
-        api_key = api_key_file.read_text().strip()
-        if api_key:
-            return api_key
+def _read_legacy_value(path: Path) -> str:
+    """Read a value kept in its own file by older versions (.api_key, .server_id)."""
+    try:
+        return path.read_text().strip()
+    except FileNotFoundError:
+        return ""
 
-    # Generate new API key and save it
-    api_key = secrets.token_urlsafe(32)
-    api_key_file.write_text(api_key)
-    return api_key
 
+def _load_state(storage_path: Path) -> dict:
+    """Load the persisted server state (API key and server ID)."""
+    try:
+        return json.loads((storage_path / ".backup_state.json").read_bytes())
+    except FileNotFoundError:
+        return {}
 
-def _load_or_create_server_id(storage_path: Path) -> str:
-    """Load server ID from file, or create a new one if it doesn't exist."""
-    server_id_file = storage_path / ".server_id"
 
-    # Ensure storage directory exists
-    storage_path.mkdir(parents=True, exist_ok=True)
+def _save_state(storage_path: Path, state: dict) -> None:
+    """Atomically write the server state file."""
+    state_file = storage_path / ".backup_state.json"
+    tmp_file = state_file.with_name(state_file.name + ".tmp")
+    tmp_file.write_text(json.dumps(state))
+    os.replace(tmp_file, state_file)
+
+
+def _load_or_create_state(storage_path: Path) -> dict:
+    """
+    Load the API key and server ID, creating any that don't exist yet.
+
+    Values from the separate .api_key/.server_id files used by older
+    versions are carried over so paired devices keep working.
+    """
+    state = _load_state(storage_path)
+    changed = False
+
+    if not state.get("api_key"):
+        state["api_key"] = (
+            _read_legacy_value(storage_path / ".api_key") or _generate_api_key()
+        )
+        changed = True
 
-    if server_id_file.exists():
-        server_id = server_id_file.read_text().strip()
-        if server_id:
-            return server_id
+    if not state.get("server_id"):
+        state["server_id"] = (
+            _read_legacy_value(storage_path / ".server_id") or str(uuid.uuid4())
+        )
+        changed = True
 
-    # Generate new server ID (UUID4) and save it
-    server_id = str(uuid.uuid4())
-    server_id_file.write_text(server_id)
-    return server_id
+    if changed:
+        _save_state(storage_path, state)
+    return state
 
 
-class Settings(BaseSettings):
-    """Application settings with environment variable support."""
+def _read_env_file(path: Path) -> dict[str, str]:
+    """Read KEY=VALUE lines from a .env file, if there is one."""
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        return {}
+
+    values = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[key.strip().upper()] = value.strip().strip("'\"")
+    return values
+
+
+# Default of Settings fields; tells values passed to the constructor apart
+# from ones left to the environment or the field's own default
+_UNSET = object()
+
+
+def _setting(default):
+    """Declare a Settings field with the given default."""
+    return dataclasses.field(default=_UNSET, metadata={"default": default})
+
+
+@dataclasses.dataclass
+class Settings:
+    """
+    Application settings with environment variable support.
+
+    Each field can be set with a BACKUP_<FIELD> environment variable or in
+    a .env file; environment variables take precedence over the .env file,
+    and values passed to the constructor over both.
+    """
+
+    ENV_PREFIX = "BACKUP_"
+    ENV_FILE = ".env"
 
     # Server settings
-    host: str = "0.0.0.0"
-    port: int = 9121
-    service_name: str = "PhotoBackupServer"
+    host: str = _setting("0.0.0.0")
+    port: int = _setting(9121)
+    service_name: str = _setting("PhotoBackupServer")
 
     # Storage settings
-    storage_path: Path = Path("./storage")
+    storage_path: Path = _setting(Path("./storage"))
 
     # Security
-    api_key: str = ""
-    server_id: str = ""
-
-    class Config:
-        env_prefix = "BACKUP_"
-        env_file = ".env"
+    api_key: str = _setting("")
+    server_id: str = _setting("")
 
     @property
     def db_path(self) -> Path:
         """Database path inside storage directory."""
         return self.storage_path / ".backup_db.sqlite"
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Ensure storage directory exists
-        self.storage_path.mkdir(parents=True, exist_ok=True)
-        # Load or generate API key if not provided via environment
-        if not self.api_key:
-            self.api_key = _load_or_create_api_key(self.storage_path)
-        # Load or generate server ID if not provided via environment
-        if not self.server_id:
-            self.server_id = _load_or_create_server_id(self.storage_path)
-
-
-settings = Settings()
+    def __post_init__(self):
+        env_file = _read_env_file(Path(self.ENV_FILE))
+        for field in dataclasses.fields(self):
+            if getattr(self, field.name) is not _UNSET:
+                continue  # Passed to the constructor
+            env_name = self.ENV_PREFIX + field.name.upper()
+            value = os.environ.get(env_name, env_file.get(env_name))
+            if value is not None:
+                setattr(self, field.name, field.type(value))
+            else:
+                setattr(self, field.name, field.metadata["default"])
+
+        # Ensure storage directory exists; it holds the API key, so keep it
+        # private to the current user
+        self.storage_path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        # Load or generate API key and server ID if not provided via environment
+        if not self.api_key or not self.server_id:
+            state = _load_or_create_state(self.storage_path)
+            if not self.api_key:
+                self.api_key = state["api_key"]
+            if not self.server_id:
+                self.server_id = state["server_id"]
+
+
+@functools.lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Get the application settings, loading them on first use."""
+    return Settings()
@@ -19,29 +19,23 @@ import asyncio
 import logging
 import sys
 
-import uvicorn
+from config import (
+    get_log_file_path,
+    get_settings,
+    get_uvicorn_log_config,
+    setup_logging,
+    stop_logging,
+)
 
-from config import settings, setup_logging, get_uvicorn_log_config
-from server.app import create_app
-from server.services.discovery import ServiceDiscovery
-from server.services.pairing import generate_pairing_qr
-
-# Setup logging before anything else
-setup_logging(settings.storage_path)
 logger = logging.getLogger(__name__)
 
-# Get uvicorn log config
-UVICORN_LOG_CONFIG = get_uvicorn_log_config(settings.storage_path)
-
 
-def print_banner(local_ip: str):
+def print_banner(local_ip: str, qr_ascii: str):
     """Print server startup information."""
-    # Generate QR code for pairing (only server_id and api_key, IP is discovered via mDNS)
-    qr_ascii = generate_pairing_qr(
-        server_id=settings.server_id,
-        api_key=settings.api_key,
-        storage_path=settings.storage_path,
-    )
+    settings = get_settings()
+    abs_path = settings.storage_path.absolute()
+    log_path = get_log_file_path(abs_path)
+    qr_path = abs_path / "pairing_qr.png"
 
     banner = f"""
 {'=' * 60}
@@ -49,8 +43,8 @@ def print_banner(local_ip: str):
 {'=' * 60}
 
   Server running at: http://{local_ip}:{settings.port}
-  Storage path:      {settings.storage_path.absolute()}
-  Log file:          {settings.storage_path.absolute() / 'server.log'}
+  Storage path:      {abs_path}
+  Log file:          {log_path}
 
   mDNS Service: _photobackup._tcp.local.
   Server ID:    {settings.server_id}
@@ -60,7 +54,7 @@ def print_banner(local_ip: str):
 {'=' * 60}
 
 {qr_ascii}
-  QR code also saved to: {settings.storage_path.absolute() / 'pairing_qr.png'}
+  QR code also saved to: {qr_path}
 
 {'=' * 60}
   Press Ctrl+C to stop the server
@@ -68,17 +62,36 @@ def print_banner(local_ip: str):
 """
     print(banner)
     logger.info(f"Server started at http://{local_ip}:{settings.port}")
-    logger.info(f"Storage path: {settings.storage_path.absolute()}")
+    logger.info(f"Storage path: {abs_path}")
     logger.info(f"Server ID: {settings.server_id}")
     logger.info("mDNS service registered: _photobackup._tcp.local.")
-    logger.info(f"Pairing QR code saved to: {settings.storage_path.absolute() / 'pairing_qr.png'}")
+    logger.info(f"Pairing QR code saved to: {qr_path}")
 
 
 async def main():
     """Run the backup server."""
+    # Imported here so only the stdlib and config load before startup
+    import uvicorn
+
+    from server.app import create_app
+    from server.services.discovery import ServiceDiscovery
+    from server.services.pairing import generate_pairing_qr
+
+    settings = get_settings()
+
     # Create FastAPI app
     app = create_app(settings)
 
+    # Generate QR code for pairing (only server_id and api_key, IP is discovered via mDNS)
+    # in a worker thread, so it overlaps with the mDNS registration below
+    qr_future = asyncio.get_running_loop().run_in_executor(
+        None,
+        generate_pairing_qr,
+        settings.server_id,
+        settings.api_key,
+        settings.storage_path,
+    )
+
     # Start mDNS service discovery
     discovery = ServiceDiscovery(
         service_name=settings.service_name,
@@ -87,7 +100,7 @@ async def main():
     )
 
     local_ip = await discovery.register()
-    print_banner(local_ip)
+    print_banner(local_ip, await qr_future)
 
     # Configure uvicorn with our logging config
     config = uvicorn.Config(
@@ -96,7 +109,11 @@ async def main():
         port=settings.port,
         log_level="info",
         access_log=True,
-        log_config=UVICORN_LOG_CONFIG,
+        log_config=get_uvicorn_log_config(),
+        http="httptools",
+        timeout_keep_alive=30,
+        limit_concurrency=256,
+        backlog=2048,
     )
     server = uvicorn.Server(config)
 
@@ -107,9 +124,20 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Setup logging before anything else
+    setup_logging(get_settings().storage_path)
+
     try:
-        asyncio.run(main())
+        if sys.platform == "win32":
+            asyncio.run(main())
+        else:
+            # uvloop isn't available on Windows
+            import uvloop
+
+            uvloop.run(main())
     except KeyboardInterrupt:
         logger.info("Server stopped by user")
         print("\nServer stopped.")
         sys.exit(0)
+    finally:
+        stop_logging()
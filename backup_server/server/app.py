@@ -37,18 +37,22 @@ def create_app(settings: Settings) -> FastAPI:
     def get_dedup():
         return dedup_service
 
+    # Encoded once; compared against every request's key
+    expected_key = settings.api_key.encode()
+
     def verify_api_key(x_api_key: str = Header(None, alias="X-API-Key")):
         if not x_api_key:
             logger.warning("API key missing in request")
             raise HTTPException(status_code=401, detail="API key required")
-        if not secrets.compare_digest(x_api_key, settings.api_key):
+        if not secrets.compare_digest(x_api_key.encode(), expected_key):
             logger.warning("Invalid API key provided")
             raise HTTPException(status_code=401, detail="Invalid API key")
-        logger.info("API key is valid")
+        logger.debug("API key is valid")
         return x_api_key
 
     # Override dependencies in routers
     app.dependency_overrides[health.get_storage_service] = get_storage
+    app.dependency_overrides[health.get_dedup_service] = get_dedup
     app.dependency_overrides[files.get_storage_service] = get_storage
     app.dependency_overrides[files.get_dedup_service] = get_dedup
     app.dependency_overrides[files.verify_api_key] = verify_api_key
@@ -96,33 +96,37 @@ async def upload_file(
         source=source,
     )
 
-    # Read file content
-    content = await file.read()
-
-    # Verify hash before saving
-    computed_hash = storage.compute_hash_from_bytes(content)
-    if computed_hash != file_hash:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Hash mismatch: expected {file_hash}, got {computed_hash}",
-        )
-
-    # Save file
-    await storage.save_file(content, relative_path)
+    # Stream the upload to disk, verifying its hash before it is moved into place
+    async def read_chunks():
+        while chunk := await file.read(storage.CHUNK_SIZE):
+            yield chunk
+
+    try:
+        if getattr(file.file, "_rolled", False):
+            # Large uploads are already spooled to a temporary file on disk
+            relative_path, file_size = await storage.save_file_copy(
+                file.file, relative_path, expected_hash=file_hash
+            )
+        else:
+            relative_path, file_size = await storage.save_file_streaming(
+                read_chunks(), relative_path, expected_hash=file_hash
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Record in dedup database
-    dedup.record(
+    await dedup.record(
         file_hash=file_hash,
         storage_path=str(relative_path),
         original_path=original_path,
         original_filename=file.filename,
-        file_size=len(content),
+        file_size=file_size,
         mime_type=actual_mime,
         source_device=device_name,
     )
 
     # Log the successful upload with filename and destination
-    file_size_kb = len(content) / 1024
+    file_size_kb = file_size / 1024
     if file_size_kb >= 1024:
         size_str = f"{file_size_kb / 1024:.1f} MB"
     else:
@@ -144,7 +148,9 @@ async def get_stats(
 ):
     """Get backup statistics."""
     db_stats = dedup.get_stats()
-    storage_info = storage.get_storage_info()
+    storage_info = storage.get_storage_info(
+        db_stats["total_files"], db_stats["total_size"]
+    )
 
     return {
         "total_files": db_stats["total_files"],
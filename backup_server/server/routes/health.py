@@ -5,6 +5,7 @@ import socket
 from fastapi import APIRouter, Depends
 
 from ..models.file_info import HealthResponse, StatusResponse
+from ..services.dedup import DedupService
 from ..services.storage import StorageService
 
 router = APIRouter(tags=["health"])
@@ -12,6 +13,9 @@ router = APIRouter(tags=["health"])
 # Will be set by app.py
 _server_id: str = ""
 
+# Looked up once; polled often by clients during a sync
+_hostname = socket.gethostname()
+
 
 def set_server_id(server_id: str):
     """Set the server ID for health check responses."""
@@ -24,21 +28,29 @@ def get_storage_service():
     raise NotImplementedError("Storage service not configured")
 
 
+def get_dedup_service():
+    """Dependency injection for dedup service - will be overridden in app.py."""
+    raise NotImplementedError("Dedup service not configured")
+
+
 @router.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """Check if the server is running."""
     return HealthResponse(
         status="ok",
         version="1.0.0",
-        server_name=socket.gethostname(),
+        server_name=_hostname,
         server_id=_server_id,
     )
 
 
 @router.get("/api/status", response_model=StatusResponse)
-async def get_status(storage: StorageService = Depends(get_storage_service)):
+async def get_status(
+    storage: StorageService = Depends(get_storage_service),
+    dedup: DedupService = Depends(get_dedup_service),
+):
     """Get server status and storage information."""
-    storage_info = storage.get_storage_info()
+    storage_info = storage.get_storage_info(*dedup.get_totals())
 
     return StatusResponse(
         status="ok",
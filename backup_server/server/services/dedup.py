@@ -1,6 +1,9 @@
 """Deduplication service using SQLite database."""
 
+import asyncio
 import sqlite3
+import threading
+from collections import deque
 from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
@@ -8,21 +11,52 @@ from typing import Generator
 
 
 class DedupService:
-    """Tracks backed-up files to prevent duplicates."""
+    """
+    Tracks backed-up files to prevent duplicates.
+
+    Hashes are hex strings in the API and 32-byte BLOBs in the database.
+    """
+
+    # Applied once to the service's connection
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",  # 256MB
+        "PRAGMA cache_size=-65536",  # 64MB
+    )
+
+    # Most rows written by record() in a single transaction
+    WRITE_BATCH_SIZE = 256
 
     def __init__(self, db_path: Path):
         self.db_path = db_path
+        self._lock = threading.Lock()
+        # Rows waiting to be inserted by the writer task, with the futures
+        # of the record() calls waiting on them
+        self._pending_writes: deque[tuple[tuple, asyncio.Future]] = deque()
+        self._writer: asyncio.Task | None = None
         self._init_db()
 
     def _init_db(self):
-        """Initialize the SQLite database."""
+        """Open the SQLite database and create the schema."""
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with self._get_connection() as conn:
+        # One connection for the lifetime of the service, shared between
+        # threads under self._lock. Autocommit mode; writes use explicit
+        # transactions.
+        self._conn = sqlite3.connect(
+            self.db_path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            self._conn.execute(pragma)
+
+        with self._transaction() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS backed_up_files (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sha256_hash TEXT UNIQUE NOT NULL,
+                    sha256_hash BLOB UNIQUE NOT NULL,
                     storage_path TEXT NOT NULL,
                     original_path TEXT,
                     original_filename TEXT,
@@ -32,43 +66,58 @@ class DedupService:
                     source_device TEXT
                 )
             """)
-            conn.execute(
-                "CREATE INDEX IF NOT EXISTS idx_hash ON backed_up_files(sha256_hash)"
+            # The UNIQUE constraint already indexes sha256_hash; older
+            # databases also had a second, identical index
+            conn.execute("DROP INDEX IF EXISTS idx_hash")
+
+            # Older databases stored hashes as 64-character hex text
+            cursor = conn.execute(
+                "SELECT id, sha256_hash FROM backed_up_files"
+                " WHERE typeof(sha256_hash) = 'text'"
+            )
+            conn.executemany(
+                "UPDATE backed_up_files SET sha256_hash = ? WHERE id = ?",
+                [(bytes.fromhex(row["sha256_hash"]), row["id"]) for row in cursor],
             )
 
+        # All recorded hashes and their total size, kept in memory so
+        # lookups and totals don't need a query. This service is the only
+        # writer, so they stay in sync with the table.
+        with self._get_connection() as conn:
+            cursor = conn.execute("SELECT sha256_hash, file_size FROM backed_up_files")
+            self._hashes: set[str] = set()
+            self._total_size = 0
+            for row in cursor:
+                self._hashes.add(row["sha256_hash"].hex())
+                self._total_size += row["file_size"] or 0
+
     @contextmanager
     def _get_connection(self) -> Generator[sqlite3.Connection, None, None]:
-        """Get a database connection with automatic commit/close."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        try:
-            yield conn
-            conn.commit()
-        finally:
-            conn.close()
+        """Get exclusive use of the database connection."""
+        with self._lock:
+            yield self._conn
+
+    @contextmanager
+    def _transaction(self) -> Generator[sqlite3.Connection, None, None]:
+        """Get the database connection inside a write transaction."""
+        with self._get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
 
     def exists(self, file_hash: str) -> bool:
         """Check if a file with the given hash already exists."""
-        with self._get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT 1 FROM backed_up_files WHERE sha256_hash = ?", (file_hash,)
-            )
-            return cursor.fetchone() is not None
+        return file_hash in self._hashes
 
     def get_existing_hashes(self, hashes: list[str]) -> set[str]:
         """Check multiple hashes at once, return the ones that exist."""
-        if not hashes:
-            return set()
+        return self._hashes.intersection(hashes)
 
-        with self._get_connection() as conn:
-            placeholders = ",".join("?" * len(hashes))
-            cursor = conn.execute(
-                f"SELECT sha256_hash FROM backed_up_files WHERE sha256_hash IN ({placeholders})",
-                hashes,
-            )
-            return {row["sha256_hash"] for row in cursor.fetchall()}
-
-    def record(
+    async def record(
         self,
         file_hash: str,
         storage_path: str,
@@ -78,36 +127,82 @@ class DedupService:
         mime_type: str | None = None,
         source_device: str | None = None,
     ) -> bool:
-        """Record a backed-up file. Returns True if successful, False if duplicate."""
-        with self._get_connection() as conn:
-            try:
-                conn.execute(
-                    """
-                    INSERT INTO backed_up_files
-                    (sha256_hash, storage_path, original_path, original_filename,
-                     file_size, mime_type, source_device)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        file_hash,
-                        storage_path,
-                        original_path,
-                        original_filename,
-                        file_size,
-                        mime_type,
-                        source_device,
-                    ),
-                )
-                return True
-            except sqlite3.IntegrityError:
-                # Duplicate hash
-                return False
+        """
+        Record a backed-up file. Returns True if successful, False if duplicate.
+
+        Rows from concurrent calls are written together in one transaction;
+        this returns once the row has been committed.
+        """
+        if file_hash in self._hashes:
+            return False
+        # Claimed before the write so later calls see it as a duplicate
+        self._hashes.add(file_hash)
+        self._total_size += file_size or 0
+
+        row = (
+            bytes.fromhex(file_hash),
+            storage_path,
+            original_path,
+            original_filename,
+            file_size,
+            mime_type,
+            source_device,
+        )
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((row, future))
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_pending())
+
+        try:
+            await future
+        except Exception:
+            # The write failed (a cancelled caller's row is still written)
+            self._hashes.discard(file_hash)
+            self._total_size -= file_size or 0
+            raise
+        return True
+
+    async def _write_pending(self) -> None:
+        """Insert queued rows in batches until the queue is empty."""
+        try:
+            while self._pending_writes:
+                batch = [
+                    self._pending_writes.popleft()
+                    for _ in range(min(len(self._pending_writes), self.WRITE_BATCH_SIZE))
+                ]
+                try:
+                    await asyncio.to_thread(self._insert_rows, [row for row, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            self._writer = None
+
+    def _insert_rows(self, rows: list[tuple]) -> None:
+        """Insert backed_up_files rows in one transaction."""
+        with self._transaction() as conn:
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO backed_up_files
+                (sha256_hash, storage_path, original_path, original_filename,
+                 file_size, mime_type, source_device)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
 
     def get_all_hashes(self) -> set[str]:
         """Get all stored file hashes."""
-        with self._get_connection() as conn:
-            cursor = conn.execute("SELECT sha256_hash FROM backed_up_files")
-            return {row["sha256_hash"] for row in cursor.fetchall()}
+        return set(self._hashes)
+
+    def get_totals(self) -> tuple[int, int]:
+        """Get the number of backed-up files and their total size in bytes."""
+        return len(self._hashes), self._total_size
 
     def get_stats(self) -> dict:
         """Get backup statistics."""
@@ -21,16 +21,21 @@ def generate_pairing_data(server_id: str, api_key: str) -> str:
     return json.dumps(data, separators=(",", ":"))
 
 
-def generate_qr_ascii(data: str) -> str:
-    """Generate an ASCII representation of a QR code."""
+def make_qr(data: str) -> qrcode.QRCode:
+    """Encode data as a QR code, ready to be rendered."""
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=1,
-        border=1,
     )
     qr.add_data(data)
     qr.make(fit=True)
+    return qr
+
+
+def generate_qr_ascii(qr: qrcode.QRCode) -> str:
+    """Generate an ASCII representation of a QR code."""
+    qr.box_size = 1
+    qr.border = 1
 
     # Generate ASCII art using block characters
     output = io.StringIO()
@@ -38,16 +43,10 @@ def generate_qr_ascii(data: str) -> str:
     return output.getvalue()
 
 
-def save_qr_image(data: str, path: Path) -> None:
+def save_qr_image(qr: qrcode.QRCode, path: Path) -> None:
     """Save a QR code as a PNG image."""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
+    qr.box_size = 10
+    qr.border = 4
 
     img = qr.make_image(fill_color="black", back_color="white")
     img.save(path)
@@ -63,11 +62,12 @@ def generate_pairing_qr(
 
     Returns the ASCII representation for display in terminal.
     """
-    pairing_data = generate_pairing_data(server_id, api_key)
+    # Encoded once, rendered twice
+    qr = make_qr(generate_pairing_data(server_id, api_key))
 
     # Save PNG image to storage directory
     qr_image_path = storage_path / "pairing_qr.png"
-    save_qr_image(pairing_data, qr_image_path)
+    save_qr_image(qr, qr_image_path)
 
     # Return ASCII for terminal display
-    return generate_qr_ascii(pairing_data)
+    return generate_qr_ascii(qr)
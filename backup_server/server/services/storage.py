@@ -1,9 +1,17 @@
 """File storage service with date-based organization."""
 
+import asyncio
 import hashlib
+import itertools
+import os
 import re
+import shutil
+import string
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from typing import BinaryIO, Generator
 
 import aiofiles
 
@@ -19,20 +27,36 @@ SOURCE_FOLDERS = {
     "downloads": "Downloads",
 }
 
+# Characters not allowed in stored filenames are replaced with "_"
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w\-_\. ]")
+
+# Same rule as a translation table for ASCII filenames (the common case)
+_SAFE_ASCII_CHARS = set(string.ascii_letters + string.digits + "-_. ")
+_ASCII_FILENAME_TABLE = str.maketrans(
+    {chr(c): "_" for c in range(128) if chr(c) not in _SAFE_ASCII_CHARS}
+)
+
 
 class StorageService:
     """Handles file storage with organization by date and media type."""
 
     CHUNK_SIZE = 1024 * 1024  # 1MB chunks for hashing
+    # Uploads are written to disk in blocks of about this size
+    WRITE_BUFFER_SIZE = 4 * 1024 * 1024
 
     def __init__(self, base_path: Path):
         self.base_path = base_path
         self.base_path.mkdir(parents=True, exist_ok=True)
+        # Paths on the upload path are built as plain strings
+        self._base_str = os.fspath(base_path)
 
     def _sanitize_filename(self, filename: str) -> str:
         """Remove dangerous characters from filename."""
         # Keep only safe characters
-        safe_name = re.sub(r"[^\w\-_\. ]", "_", filename)
+        if filename.isascii():
+            safe_name = filename.translate(_ASCII_FILENAME_TABLE)
+        else:
+            safe_name = _UNSAFE_FILENAME_CHARS.sub("_", filename)
         # Remove leading/trailing spaces and dots
         safe_name = safe_name.strip(". ")
         return safe_name or "unnamed"
@@ -74,54 +98,202 @@ class StorageService:
         media_folder = self._get_media_folder(mime_type, source)
         safe_filename = self._sanitize_filename(filename)
 
-        relative_path = (
-            Path(media_folder)
-            / str(date_taken.year)
-            / f"{date_taken.month:02d}"
-            / safe_filename
+        relative_path = os.path.join(
+            media_folder, str(date_taken.year), f"{date_taken.month:02d}", safe_filename
         )
 
-        # Handle filename collisions
-        full_path = self.base_path / relative_path
-        if full_path.exists():
-            stem = full_path.stem
-            suffix = full_path.suffix
-            counter = 1
-            while full_path.exists():
-                new_name = f"{stem}_{counter}{suffix}"
-                relative_path = relative_path.parent / new_name
-                full_path = self.base_path / relative_path
-                counter += 1
+        # Filename collisions are resolved when the file is saved
+        return Path(relative_path)
+
+    @staticmethod
+    def _candidate_names(name: str, file_hash: str | None):
+        """
+        Yield file names to try for a file, in order of preference.
 
-        return relative_path
+        The original name first, then with the start of the file hash added
+        (which makes another collision very unlikely), then with a counter.
+        """
+        stem, suffix = os.path.splitext(name)
+        yield name
+        if file_hash:
+            stem = f"{stem}_{file_hash[:8]}"
+            yield f"{stem}{suffix}"
+        for counter in itertools.count(1):
+            yield f"{stem}_{counter}{suffix}"
+
+    @contextmanager
+    def _part_file(self, relative_path: Path) -> Generator[str, None, None]:
+        """
+        Create a temporary file to write a new file's data to.
 
-    async def save_file(self, content: bytes, relative_path: Path) -> Path:
-        """Save file content to the storage location."""
-        dest_path = self.base_path / relative_path
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        It is created in the folder relative_path will be stored in, ready to
+        be published with _publish, and is removed when the block exits unless
+        it was.
+        """
+        folder = os.path.join(self._base_str, os.path.dirname(relative_path))
+        os.makedirs(folder, exist_ok=True)
+        # Created exclusively under a name no upload can get: sanitized
+        # filenames never start with a dot
+        fd, part_path = tempfile.mkstemp(dir=folder, prefix=".", suffix=".part")
+        os.close(fd)
+        # mkstemp creates the file owner-only; stored files are 0o644
+        os.chmod(part_path, 0o644)
+
+        try:
+            yield part_path
+        finally:
+            try:
+                os.unlink(part_path)
+            except FileNotFoundError:
+                pass
+
+    def _publish(self, part_path: str, relative_path: Path, file_hash: str | None) -> Path:
+        """
+        Move a finished file to a free storage path, never replacing a file.
 
-        async with aiofiles.open(dest_path, "wb") as f:
-            await f.write(content)
+        If relative_path is taken, a different name is used (see
+        _candidate_names). Returns the path used, relative to the storage root.
+        """
+        folder, filename = os.path.split(os.fspath(relative_path))
+        for name in self._candidate_names(filename, file_hash):
+            candidate = os.path.join(folder, name)
+            dest_path = os.path.join(self._base_str, candidate)
+            try:
+                # Fails if the name is taken, so two uploads can't both get it
+                os.link(part_path, dest_path)
+            except FileExistsError:
+                continue
+            except OSError:
+                # No hard links on this filesystem: claim the name with an
+                # empty file, then move the data over it
+                try:
+                    fd = os.open(dest_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+                except FileExistsError:
+                    continue
+                os.close(fd)
+                try:
+                    os.replace(part_path, dest_path)
+                except BaseException:
+                    os.unlink(dest_path)
+                    raise
+            else:
+                os.unlink(part_path)
+            return Path(candidate)
 
-        return dest_path
+    @staticmethod
+    def _check_hash(expected_hash: str, actual_hash: str) -> None:
+        """Raise ValueError if a file's hash isn't the expected one."""
+        if actual_hash != expected_hash:
+            raise ValueError(
+                f"Hash mismatch: expected {expected_hash}, got {actual_hash}"
+            )
 
     async def save_file_streaming(
-        self, file_iterator, relative_path: Path
+        self, file_iterator, relative_path: Path, expected_hash: str | None = None
     ) -> tuple[Path, int]:
         """
         Save file from an async iterator (for large files).
-        Returns the destination path and total bytes written.
-        """
-        dest_path = self.base_path / relative_path
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
 
+        If relative_path is taken, the file is saved under a different name.
+        If expected_hash is given, the SHA-256 of the data is computed while
+        writing; on a mismatch nothing is saved and ValueError is raised.
+
+        Returns the path the file was saved to, relative to the storage root,
+        and total bytes written.
+        """
+        sha256 = hashlib.sha256() if expected_hash is not None else None
         total_bytes = 0
-        async with aiofiles.open(dest_path, "wb") as f:
-            async for chunk in file_iterator:
-                await f.write(chunk)
-                total_bytes += len(chunk)
+        with self._part_file(relative_path) as part_path:
+            f = await asyncio.to_thread(open, part_path, "wb")
+            try:
+                # Chunks are collected into one block, which is hashed and
+                # written in a single worker thread call
+                buffer = bytearray()
+                async for chunk in file_iterator:
+                    buffer += chunk
+                    total_bytes += len(chunk)
+                    if len(buffer) >= self.WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(self._write_block, f, buffer, sha256)
+                        buffer.clear()
+                if buffer:
+                    await asyncio.to_thread(self._write_block, f, buffer, sha256)
+            finally:
+                await asyncio.to_thread(f.close)
+
+            if sha256 is not None:
+                self._check_hash(expected_hash, sha256.hexdigest())
+
+            relative_path = self._publish(part_path, relative_path, expected_hash)
+
+        return relative_path, total_bytes
+
+    async def save_file_copy(
+        self, source: BinaryIO, relative_path: Path, expected_hash: str | None = None
+    ) -> tuple[Path, int]:
+        """
+        Save a copy of a file that is open on disk (e.g. a spooled upload).
+
+        Same as save_file_streaming, but the data is hashed and copied by the
+        OS without passing through Python, where the platform allows it.
+        """
+        with self._part_file(relative_path) as part_path:
+            total_bytes = await asyncio.to_thread(
+                self._copy_file, source, part_path, expected_hash
+            )
+            relative_path = self._publish(part_path, relative_path, expected_hash)
+
+        return relative_path, total_bytes
+
+    def _copy_file(
+        self, source: BinaryIO, dest_path: str, expected_hash: str | None
+    ) -> int:
+        """Check the hash of an open file and copy it to dest_path."""
+        if expected_hash is not None:
+            source.seek(0)
+            self._check_hash(expected_hash, self._hash_file(source))
+
+        size = os.fstat(source.fileno()).st_size
+        with open(dest_path, "wb", buffering=0) as dest:
+            offset = 0
+            # No os.sendfile on Windows
+            use_sendfile = hasattr(os, "sendfile")
+            while use_sendfile and offset < size:
+                try:
+                    sent = os.sendfile(
+                        dest.fileno(), source.fileno(), offset, size - offset
+                    )
+                except OSError:
+                    # Can't copy between these files; fall back to copying
+                    # in Python if nothing was sent yet
+                    if offset:
+                        raise
+                    use_sendfile = False
+                    break
+                if sent == 0:
+                    break
+                offset += sent
+
+            if not use_sendfile:
+                source.seek(0)
+                shutil.copyfileobj(source, dest, self.CHUNK_SIZE)
+                offset = dest.tell()
+        return offset
+
+    def _hash_file(self, source: BinaryIO) -> str:
+        """Compute SHA-256 hash of an open file from its current position."""
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+
+            return hashlib.file_digest(source, "sha256").hexdigest()
+        sha256 = hashlib.sha256()
+        while chunk := source.read(self.CHUNK_SIZE):
+            sha256.update(chunk)
+        return sha256.hexdigest()
 
-        return dest_path, total_bytes
+    @staticmethod
+    def _write_block(f, block: bytearray, sha256) -> None:
+        """Write a block to an open file, feeding it to the hash if given."""
+        if sha256 is not None:
+            sha256.update(block)
+        f.write(block)
 
     async def compute_hash(self, file_path: Path) -> str:
         """Compute SHA-256 hash of a file."""
@@ -148,19 +320,11 @@ class StorageService:
             return True
         return False
 
-    def get_storage_info(self) -> dict:
-        """Get storage statistics."""
-        total_size = 0
-        file_count = 0
-
-        for file_path in self.base_path.rglob("*"):
-            if file_path.is_file() and not file_path.name.startswith("."):
-                total_size += file_path.stat().st_size
-                file_count += 1
-
+    def get_storage_info(self, total_files: int, total_size: int) -> dict:
+        """Get storage statistics from the backed-up file totals."""
         return {
             "storage_path": str(self.base_path.absolute()),
-            "total_files": file_count,
+            "total_files": total_files,
             "total_size_bytes": total_size,
             "total_size_human": self._format_size(total_size),
         }
@@ -168,8 +332,7 @@ class StorageService:
     @staticmethod
     def _format_size(size_bytes: int) -> str:
         """Format bytes to human readable string."""
-        for unit in ["B", "KB", "MB", "GB", "TB"]:
-            if size_bytes < 1024:
-                return f"{size_bytes:.2f} {unit}"
-            size_bytes /= 1024
-        return f"{size_bytes:.2f} PB"
+        units = ("B", "KB", "MB", "GB", "TB", "PB")
+        # Each unit is 2**10 times the previous one
+        idx = min((max(size_bytes, 1).bit_length() - 1) // 10, len(units) - 1)
+        return f"{size_bytes / (1 << (idx * 10)):.2f} {units[idx]}"